@@ -1,12 +1,31 @@
 # app.py
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import atexit
+import hashlib
+import hmac
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
+import queue
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, wraps
+from typing import Iterator, Optional
+
+import diskcache
+import httpx
+import numpy as np
+import orjson
 from dotenv import load_dotenv
-from flask import Flask, request, render_template_string
+from flask import Flask, Response, abort, jsonify, render_template, request, stream_with_context, url_for
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
+from markupsafe import escape
 
 from google import genai
+from google.genai import errors, types
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # 1. Load API key from apikey.env
@@ -17,114 +36,252 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY not found in environment. Check apikey.env")
 
-client = genai.Client(api_key=GEMINI_API_KEY)
+
+def create_client() -> genai.Client:
+    """
+    Build the process-wide Gemini client. Its httpx pool keeps TLS
+    connections to Gemini alive between calls, and HTTP/2 multiplexes
+    concurrent requests over a single connection.
+    """
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=types.HttpOptions(
+            api_version="v1beta",
+            # Milliseconds; generous enough for the model to think before streaming
+            timeout=60_000,
+            client_args={
+                "http2": True,
+                "limits": httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            },
+        ),
+    )
+
+
+# Created once per process and never re-instantiated per call
+client = create_client()
 
 MODEL_NAME = "gemini-2.5-flash"
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # 2. Core LLM helper
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def call_gemini(prompt: str) -> str:
+class TokenBucket:
     """
-    Call Gemini 2.5 Flash with a text prompt and return response text.
+    Token bucket holding up to `per_minute` tokens and refilling
+    continuously at `per_minute` tokens per minute.
+
+    Its state is kept under `name` in a diskcache store, so every thread of
+    every gunicorn worker draws from the same budget.
     """
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=prompt
-    )
-    return response.text or ""
 
+    def __init__(self, store: diskcache.Cache, name: str, per_minute: float):
+        self.store = store
+        self.name = name
+        self.capacity = float(per_minute)
+        self.refill_rate = self.capacity / 60.0
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Block until `amount` tokens are available, then take them and return
+        True. Returns False, taking nothing, when that would mean waiting
+        longer than `timeout` seconds.
+
+        An amount larger than the capacity waits for a full bucket and
+        leaves it in debt, so oversized calls still respect the average rate.
+        """
+        needed = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.store.transact(retry=True):
+                # Wall-clock time, since the state is shared between processes
+                now = time.time()
+                tokens, updated = self.store.get(self.name, (self.capacity, now))
+                tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+                if tokens >= needed:
+                    self.store.set(self.name, (tokens - amount, now))
+                    return True
+                wait = (needed - tokens) / self.refill_rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# GEMINI_RPM / GEMINI_TPM are the budget for the whole deployment, shared by
+# all workers. Defaults sit just under the free-tier limits for Gemini 2.5 Flash.
+rate_limit_store = diskcache.Cache(os.getenv("RATE_LIMIT_DIR", os.path.join("cache", "ratelimit")))
+request_bucket = TokenBucket(rate_limit_store, "requests", float(os.getenv("GEMINI_RPM", "9")))
+token_bucket = TokenBucket(rate_limit_store, "tokens", float(os.getenv("GEMINI_TPM", "240000")))
+
+# Longest a call may queue for budget before the user is told to come back later
+MAX_QUOTA_WAIT = float(os.getenv("MAX_QUOTA_WAIT", "30"))
+
+MAX_RETRIES = 3
+# Longer server-requested waits fail fast instead of parking the request thread
+MAX_RETRY_DELAY = 30.0
+RETRYABLE_STATUS_CODES = (429, 503)
+
+
+class GeminiUnavailableError(RuntimeError):
+    """
+    Raised when Gemini keeps rejecting calls (rate limited or overloaded).
+    """
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# 3. Agent prompt definitions
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def cardiologist_agent(medical_report: str) -> str:
-    prompt = f"""
-You are an experienced cardiologist.
+def wait_for_quota(text: str):
+    """
+    Take one request and an estimated token count (~4 chars per token)
+    from the budget, sleeping until both are available. Raises
+    GeminiUnavailableError if that would take longer than MAX_QUOTA_WAIT.
+    """
+    deadline = time.monotonic() + MAX_QUOTA_WAIT
+    if not (
+        request_bucket.acquire(timeout=MAX_QUOTA_WAIT)
+        and token_bucket.acquire(len(text) // 4 + 1, timeout=deadline - time.monotonic())
+    ):
+        raise GeminiUnavailableError("Gemini budget exhausted; try again later.")
 
-You are reviewing the following medical report. Analyze ONLY from a cardiology perspective.
 
-Report:
-\"\"\"{medical_report}\"\"\"
+def retry_delay(error: errors.APIError, attempt: int) -> float:
+    """
+    Seconds to wait before retrying: the server's Retry-After header or
+    RetryInfo hint when present, exponential backoff otherwise.
+    """
+    if error.response is not None:
+        retry_after = error.response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
 
-Tasks:
-1. Identify any possible cardiovascular issues, risk factors, and red flags.
-2. Suggest possible differential diagnoses (cardiology-focused), clearly marked as *not confirmed*.
-3. Recommend further tests or evaluations that a real cardiologist might order.
-4. Provide a short explanation understandable to a layperson.
+    if isinstance(error.details, dict):
+        for detail in error.details.get("error", {}).get("details", []):
+            delay = str(detail.get("retryDelay", ""))
+            if delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
 
-IMPORTANT:
-- Do NOT provide actual medical diagnosis or treatment.
-- Clearly state that this is for educational purposes only and not medical advice.
-"""
-    return call_gemini(prompt)
+    return float(2 ** attempt)
 
 
-def psychologist_agent(medical_report: str) -> str:
-    prompt = f"""
-You are an experienced clinical psychologist.
+def user_message(*texts: str) -> types.Content:
+    """
+    Build a single user turn with one text part per argument.
+    """
+    return types.Content(role="user", parts=[types.Part(text=text) for text in texts])
 
-You are reviewing the following medical report. Analyze ONLY from a psychological / mental health perspective.
 
-Report:
-\"\"\"{medical_report}\"\"\"
+def prompt_text(prompt) -> str:
+    if isinstance(prompt, types.Content):
+        return "".join(part.text or "" for part in prompt.parts)
+    return prompt
 
-Tasks:
-1. Identify possible psychological patterns, symptoms, or concerns.
-2. Suggest possible differential psychological explanations, clearly marked as *not confirmed*.
-3. Suggest what kind of real-world psychological assessments or referrals might be appropriate.
-4. Provide a short explanation understandable to a layperson.
+
+def stream_gemini(prompt, rubric: str, **config) -> Iterator[str]:
+    """
+    Call Gemini 2.5 Flash with a prompt (a string or a multi-part
+    types.Content) and yield the response text chunk by chunk as it is
+    generated.
+
+    Every call carries the shared preamble for its `rubric` (see
+    preamble_config); extra keyword arguments are added to the
+    generation config.
+    Calls are paced by the request/token buckets. Rate-limit and overload
+    errors are retried (only before any text has been yielded); once
+    retries run out, GeminiUnavailableError is raised.
+    """
+    generation_config = preamble_config(rubric, **config)
+    # The system instruction is billed as input tokens on every call too
+    billed_text = prompt_text(prompt) + prompt_text(generation_config.system_instruction)
+
+    for attempt in range(MAX_RETRIES + 1):
+        wait_for_quota(billed_text)
+        started = False
+        try:
+            response = client.models.generate_content_stream(
+                model=MODEL_NAME,
+                contents=prompt,
+                config=generation_config,
+            )
+            for chunk in response:
+                started = True
+                if chunk.text:
+                    yield chunk.text
+            return
+        except errors.APIError as error:
+            if started or error.code not in RETRYABLE_STATUS_CODES:
+                raise
+            delay = retry_delay(error, attempt)
+            if attempt == MAX_RETRIES or delay > MAX_RETRY_DELAY:
+                raise GeminiUnavailableError("Gemini is rate limited; try again later.") from error
+            time.sleep(delay)
+
+
+def call_gemini(prompt, rubric: str, **config) -> str:
+    """
+    Call Gemini 2.5 Flash with a prompt and return response text.
+    """
+    return "".join(stream_gemini(prompt, rubric, **config))
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 3. Agent prompt definitions
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Boilerplate shared by every prompt. It travels as the system instruction
+# (see preamble_config), so each call's contents only carry its own request.
+SHARED_DISCLAIMER = """
+You are part of an educational, AI-generated medical report review tool.
 
 IMPORTANT:
-- Do NOT provide actual diagnosis or treatment.
+- Do NOT provide actual medical diagnosis or treatment.
 - Clearly state that this is for educational purposes only and not medical advice.
+- Mark every possible diagnosis or explanation as *not confirmed*.
 """
-    return call_gemini(prompt)
 
+PANEL_RUBRIC = """
+SPECIALIST PANEL
+You are a panel of three experienced specialists: a cardiologist, a clinical psychologist and a pulmonologist.
+Each specialist analyzes the medical report ONLY from their own perspective.
 
-def pulmonologist_agent(medical_report: str) -> str:
-    prompt = f"""
-You are an experienced pulmonologist.
+Write exactly three sections, in this order, each wrapped in its markers:
 
-You are reviewing the following medical report. Analyze ONLY from a respiratory / pulmonology perspective.
+===BEGIN:CARDIOLOGY===
+(cardiologist's analysis)
+===END:CARDIOLOGY===
+===BEGIN:PSYCHOLOGY===
+(psychologist's analysis)
+===END:PSYCHOLOGY===
+===BEGIN:PULMONOLOGY===
+(pulmonologist's analysis)
+===END:PULMONOLOGY===
 
-Report:
-\"\"\"{medical_report}\"\"\"
+CARDIOLOGY tasks (experienced cardiologist, cardiology perspective only):
+1. Identify any possible cardiovascular issues, risk factors, and red flags.
+2. Suggest possible differential diagnoses (cardiology-focused), clearly marked as *not confirmed*.
+3. Recommend further tests or evaluations that a real cardiologist might order.
+4. Provide a short explanation understandable to a layperson.
+
+PSYCHOLOGY tasks (experienced clinical psychologist, psychological / mental health perspective only):
+1. Identify possible psychological patterns, symptoms, or concerns.
+2. Suggest possible differential psychological explanations, clearly marked as *not confirmed*.
+3. Suggest what kind of real-world psychological assessments or referrals might be appropriate.
+4. Provide a short explanation understandable to a layperson.
 
-Tasks:
+PULMONOLOGY tasks (experienced pulmonologist, respiratory / pulmonology perspective only):
 1. Identify possible respiratory issues, patterns, or risk factors.
 2. Suggest possible differential diagnoses (pulmonology-focused), clearly marked as *not confirmed*.
 3. Recommend further tests or evaluations a pulmonologist might consider.
 4. Provide a short explanation understandable to a layperson.
 
-IMPORTANT:
-- Do NOT provide actual medical diagnosis or treatment.
-- Clearly state that this is for educational purposes only and not medical advice.
+In every section, state that this is for educational purposes only and not medical advice.
+Do not write anything outside the markers.
 """
-    return call_gemini(prompt)
-
-
-def multidisciplinary_team_agent(cardiologist_report: str,
-                                 psychologist_report: str,
-                                 pulmonologist_report: str) -> str:
-    prompt = f"""
-You are a multidisciplinary medical team composed of:
-- Cardiologist
-- Psychologist
-- Pulmonologist
 
+TEAM_RUBRIC = """
+MULTIDISCIPLINARY TEAM
+You are a multidisciplinary medical team composed of a cardiologist, a psychologist and a pulmonologist.
 Each specialist has provided a preliminary (non-diagnostic) report.
 
-Cardiologist report:
-\"\"\"{cardiologist_report}\"\"\"
-
-Psychologist report:
-\"\"\"{psychologist_report}\"\"\"
-
-Pulmonologist report:
-\"\"\"{pulmonologist_report}\"\"\"
-
 Your task:
 1. Integrate these three perspectives into a single, coherent narrative.
 2. Highlight possible connections between cardiovascular, psychological, and respiratory aspects.
@@ -137,31 +294,383 @@ CRITICAL:
 - Repeatedly remind that this is NOT medical advice and NOT a substitute for a real doctor.
 - Label the output clearly as an AI-generated educational summary.
 """
-    return call_gemini(prompt)
+
+BATCH_RUBRIC = """
+BATCH
+Several unrelated reports, each with an id. Analyze every report on its own, never mixing
+details between reports, and write its three SPECIALIST PANEL analyses following the rules above.
+Answer with the requested JSON only; section markers are not used in batch answers.
+"""
+
+# System instruction for each kind of call: the disclaimer plus only the
+# rubric sections that call needs. The preamble is below the 1024-token
+# minimum for an explicit context cache; keeping it first and identical
+# across calls leaves prefix reuse to Gemini 2.5's implicit caching.
+PREAMBLES = {
+    "panel": SHARED_DISCLAIMER + PANEL_RUBRIC,
+    "team": SHARED_DISCLAIMER + TEAM_RUBRIC,
+    "batch": SHARED_DISCLAIMER + PANEL_RUBRIC + BATCH_RUBRIC,
+}
+
+
+def preamble_config(rubric: str, **config) -> types.GenerateContentConfig:
+    """
+    Generation config whose system instruction is the shared preamble for
+    `rubric` ("panel", "team" or "batch").
+    """
+    return types.GenerateContentConfig(system_instruction=PREAMBLES[rubric], **config)
+
+
+# The three specialists share one Gemini call: the report is embedded once and
+# each specialist writes its answer between its own sentinel markers.
+SPECIALIST_SECTIONS = {
+    "Cardiologist": "CARDIOLOGY",
+    "Psychologist": "PSYCHOLOGY",
+    "Pulmonologist": "PULMONOLOGY",
+}
+
+# Tolerates spacing, case and markdown decoration (e.g. **===BEGIN:X===**)
+SECTION_PATTERN = re.compile(
+    r"===\s*BEGIN\s*:\s*(CARDIOLOGY|PSYCHOLOGY|PULMONOLOGY)\s*===(.*?)===\s*END\s*:\s*\1\s*===",
+    re.DOTALL | re.IGNORECASE,
+)
+MARKER_PATTERN = re.compile(r"[*_`#]*===\s*(?:BEGIN|END)\s*:\s*\w+\s*===[*_`]*", re.IGNORECASE)
+
+
+# Per-call instructions. Reports are never spliced into these: each report
+# travels as its own text part after the instructions.
+SPECIALISTS_INSTRUCTIONS = """
+Act as the specialist panel: cardiology, psychology and pulmonology sections per the rubric.
+The medical report is the next part of this message.
+"""
+
+# Filled with str.format. Only the template text is parsed for fields, so
+# braces inside specialist reports are passed through as-is.
+TEAM_TEMPLATE = """
+Act as the multidisciplinary team: integrate the specialist reports below per the rubric.
+
+Cardiologist report:
+\"\"\"{cardiologist_report}\"\"\"
+
+Psychologist report:
+\"\"\"{psychologist_report}\"\"\"
+
+Pulmonologist report:
+\"\"\"{pulmonologist_report}\"\"\"
+"""
+
+
+BATCH_INSTRUCTIONS = """
+Act as the batch reviewer: analyze every report per the rubric.
+Each following part of this message is one report, given as JSON {"id": ..., "report": ...}.
+
+Return a JSON array with one object per report: "id" (copied from the report),
+"cardio", "psych" and "pulm" (the specialist analyses).
+"""
+
+BATCH_RESPONSE_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            field: types.Schema(type=types.Type.STRING)
+            for field in ("id", "cardio", "psych", "pulm")
+        },
+        required=["id", "cardio", "psych", "pulm"],
+    ),
+)
+
+
+def specialists_prompt(medical_report: str) -> types.Content:
+    return user_message(SPECIALISTS_INSTRUCTIONS, medical_report)
+
+
+def batched_specialists(medical_report: str) -> dict:
+    """
+    Run the cardiologist, psychologist and pulmonologist in a single Gemini
+    call and return their reports keyed by specialist name.
+    """
+    text = call_gemini(specialists_prompt(medical_report), "panel")
+    if not text.strip():
+        raise GeminiUnavailableError("Gemini returned an empty specialist response.")
+    return split_specialist_sections(text)
+
+
+def stream_specialists(medical_report: str) -> Iterator[tuple]:
+    """
+    Run the batched specialist call as a stream and yield (name, report)
+    for each specialist as soon as its closing marker arrives.
+
+    Stops reading once all three sections are complete, so the caller can
+    start the team call without waiting for trailing tokens.
+    """
+    names_by_tag = {tag: name for name, tag in SPECIALIST_SECTIONS.items()}
+    buffer = ""
+    position = 0
+    finished = set()
+
+    for chunk in stream_gemini(specialists_prompt(medical_report), "panel"):
+        buffer += chunk
+        for match in SECTION_PATTERN.finditer(buffer, position):
+            position = match.end()
+            tag, body = match.group(1).upper(), clean_section(match.group(2))
+            if tag not in finished and body:
+                finished.add(tag)
+                yield names_by_tag[tag], body
+        if len(finished) == len(SPECIALIST_SECTIONS):
+            return
+
+    if not buffer.strip():
+        raise GeminiUnavailableError("Gemini returned an empty specialist response.")
+
+    # Stream ended with sections missing; fall back to the unsplit text.
+    fallback = section_fallback(buffer)
+    for tag, name in names_by_tag.items():
+        if tag not in finished:
+            yield name, fallback
+
+
+def clean_section(body: str) -> str:
+    # Drop whitespace and markdown emphasis left over from decorated markers
+    return body.strip().strip("*_`").strip()
+
+
+def section_fallback(text: str) -> str:
+    """
+    Text for a specialist whose section could not be found: whatever the
+    model wrote outside the recognised sections, or else the whole
+    response, with any stray markers removed.
+    """
+    leftover = clean_section(MARKER_PATTERN.sub("", SECTION_PATTERN.sub("", text)))
+    return leftover or clean_section(MARKER_PATTERN.sub("", text))
+
+
+def split_specialist_sections(text: str) -> dict:
+    """
+    Split a batched specialist response on its sentinel markers.
+    Sections the model left out or mangled fall back to the unsplit text,
+    so the team call never runs on an empty specialist report.
+    """
+    sections = {}
+    for tag, body in SECTION_PATTERN.findall(text):
+        body = clean_section(body)
+        if body:
+            sections.setdefault(tag.upper(), body)
+
+    fallback = section_fallback(text) if len(sections) < len(SPECIALIST_SECTIONS) else ""
+    return {
+        name: sections.get(tag) or fallback
+        for name, tag in SPECIALIST_SECTIONS.items()
+    }
+
+
+# Thin wrappers kept for callers that want a single specialist.
+def cardiologist_agent(medical_report: str) -> str:
+    return batched_specialists(medical_report)["Cardiologist"]
+
+
+def psychologist_agent(medical_report: str) -> str:
+    return batched_specialists(medical_report)["Psychologist"]
+
+
+def pulmonologist_agent(medical_report: str) -> str:
+    return batched_specialists(medical_report)["Pulmonologist"]
+
+
+def multidisciplinary_team_prompt(cardiologist_report: str,
+                                  psychologist_report: str,
+                                  pulmonologist_report: str) -> str:
+    return TEAM_TEMPLATE.format(
+        cardiologist_report=cardiologist_report,
+        psychologist_report=psychologist_report,
+        pulmonologist_report=pulmonologist_report,
+    )
+
+
+def multidisciplinary_team_agent(cardiologist_report: str,
+                                 psychologist_report: str,
+                                 pulmonologist_report: str) -> str:
+    return call_gemini(multidisciplinary_team_prompt(
+        cardiologist_report, psychologist_report, pulmonologist_report
+    ), "team")
+
+
+def stream_multidisciplinary_team(cardiologist_report: str,
+                                  psychologist_report: str,
+                                  pulmonologist_report: str) -> Iterator[str]:
+    return stream_gemini(multidisciplinary_team_prompt(
+        cardiologist_report, psychologist_report, pulmonologist_report
+    ), "team")
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# 4. Function to run all agents concurrently
+# 4. Result cache (exact + optional semantic)
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def analyze_medical_report(medical_report: str):
-    agents = {
-        "Cardiologist": cardiologist_agent,
-        "Psychologist": psychologist_agent,
-        "Pulmonologist": pulmonologist_agent,
-    }
+# Exact tier: SHA-256 of the normalized report -> cached analysis, persisted
+# on disk so it survives restarts.
+result_cache = diskcache.Cache(os.getenv("CACHE_DIR", "cache"))
 
-    responses = {}
+# Semantic tier: in-process (embedding, exact key) pairs, matched by cosine
+# similarity. Off by default, since two reports that differ only in a lab
+# value can still be near-identical to an embedding model.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+EMBEDDING_MODEL = "gemini-embedding-001"
+
+_semantic_entries = []
+_semantic_lock = threading.Lock()
+
+
+def normalize_report(medical_report: str) -> str:
+    return " ".join(medical_report.split()).lower()
+
+
+def report_cache_key(medical_report: str) -> str:
+    return hashlib.sha256(normalize_report(medical_report).encode("utf-8")).hexdigest()
+
+
+def embed_report(medical_report: str) -> Optional[np.ndarray]:
+    """
+    Return the unit-length Gemini embedding of a report, or None if the
+    embedding call fails (the semantic tier is best effort).
+    """
+    # The embedding model has its own quota, separate from the Flash budget
+    try:
+        result = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=normalize_report(medical_report),
+        )
+    except Exception:
+        app.logger.warning("Embedding failed; skipping semantic cache", exc_info=True)
+        return None
+
+    vector = np.asarray(result.embeddings[0].values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def cache_lookup(medical_report: str) -> tuple:
+    """
+    Look a report up in the cache.
+
+    Returns (cached_result, embedding). cached_result is None on a miss;
+    embedding is the report's embedding when the semantic tier computed
+    one, so cache_store can reuse it.
+    """
+    key = report_cache_key(medical_report)
+    cached = result_cache.get(key)
+    if cached is not None or not SEMANTIC_CACHE_ENABLED:
+        return cached, None
+
+    embedding = embed_report(medical_report)
+    if embedding is None:
+        return None, None
+
+    with _semantic_lock:
+        entries = list(_semantic_entries)
+    if entries:
+        similarities = np.vstack([vector for vector, _ in entries]) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] > SEMANTIC_CACHE_THRESHOLD:
+            cached = result_cache.get(entries[best][1])
+
+    return cached, embedding
+
+
+def is_complete_analysis(result: tuple) -> bool:
+    """
+    True when every specialist section and the team summary have content.
+    """
+    responses, final_diagnosis_text, _ = result
+    summary = final_diagnosis_text.removeprefix(FINAL_SUMMARY_HEADER)
+    return (
+        all(responses.get(name, "").strip() for name in SPECIALIST_SECTIONS)
+        and bool(summary.strip())
+    )
+
+
+def cache_store(medical_report: str, result: tuple, embedding: Optional[np.ndarray] = None):
+    """
+    Cache a finished analysis. Incomplete results are never stored, since
+    cached entries do not expire.
+    """
+    if not is_complete_analysis(result):
+        app.logger.warning("Not caching incomplete analysis")
+        return
 
-    # Run agents concurrently
-    with ThreadPoolExecutor() as executor:
-        future_to_name = {
-            executor.submit(func, medical_report): name
-            for name, func in agents.items()
-        }
+    key = report_cache_key(medical_report)
+    result_cache.set(key, result)
+    if embedding is not None:
+        with _semantic_lock:
+            _semantic_entries.append((embedding, key))
 
-        for future in as_completed(future_to_name):
-            name = future_to_name[future]
-            responses[name] = future.result()
+
+def cache_clear() -> int:
+    with _semantic_lock:
+        _semantic_entries.clear()
+    return result_cache.clear()
+
+
+def cached_analysis(func):
+    """
+    Serve repeated (or, with the semantic tier, near-duplicate) reports
+    from the cache instead of calling Gemini again.
+    """
+    @wraps(func)
+    def wrapper(medical_report: str):
+        cached, embedding = cache_lookup(medical_report)
+        if cached is not None:
+            return cached
+
+        result = func(medical_report)
+        cache_store(medical_report, result, embedding)
+        return result
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# 5. Function to run all agents
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+FINAL_SUMMARY_HEADER = "### Final AI-Generated Educational Summary (NOT Medical Advice):\n\n"
+
+
+RESULTS_DIR = "results"
+
+# A single background thread does all result writes, so requests never wait
+# on disk and writes never interleave. Pending writes are flushed at exit.
+_result_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-writer")
+atexit.register(_result_writer.shutdown, wait=True)
+
+
+def write_text_file(path: str, text: str):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except OSError:
+        app.logger.exception("Could not save %s", path)
+
+
+def save_final_diagnosis(medical_report: str, final_diagnosis_text: str) -> str:
+    """
+    Queue the summary to be written to results/<report hash>.txt and return
+    that path straight away.
+    """
+    txt_output_path = os.path.join(RESULTS_DIR, f"{report_cache_key(medical_report)}.txt")
+    _result_writer.submit(write_text_file, txt_output_path, final_diagnosis_text)
+    return txt_output_path
+
+
+def run_agents(medical_report: str) -> tuple:
+    """
+    Analyze one report: specialist panel (pooled with concurrent reports by
+    batch_scheduler), then the team call.
+    Returns (specialist responses, team summary).
+    """
+    responses = batch_scheduler.submit(medical_report).result()
 
     # Team-level integration
     final_diagnosis = multidisciplinary_team_agent(
@@ -169,460 +678,484 @@ def analyze_medical_report(medical_report: str):
         psychologist_report=responses["Psychologist"],
         pulmonologist_report=responses["Pulmonologist"],
     )
+    return responses, final_diagnosis
+
+
+# Output budget per report in a batch (thinking tokens count against it),
+# capped at Gemini 2.5 Flash's output limit
+BATCH_OUTPUT_TOKENS_PER_REPORT = 8192
+MAX_OUTPUT_TOKENS = 65536
+
+
+def analyze_batch(reports: dict) -> dict:
+    """
+    Run the specialist panel for several reports ({id: report}) in one
+    structured-output Gemini call. Returns {id: specialist responses} for
+    every report the model answered in full.
+    """
+    report_parts = [
+        orjson.dumps({"id": report_id, "report": report}).decode("utf-8")
+        for report_id, report in reports.items()
+    ]
+    text = call_gemini(
+        user_message(BATCH_INSTRUCTIONS, *report_parts),
+        "batch",
+        response_mime_type="application/json",
+        response_schema=BATCH_RESPONSE_SCHEMA,
+        max_output_tokens=min(MAX_OUTPUT_TOKENS, BATCH_OUTPUT_TOKENS_PER_REPORT * len(reports)),
+    )
+
+    results = {}
+    for item in orjson.loads(text):
+        if item.get("id") not in reports:
+            continue
+        sections = [str(item.get(field) or "").strip() for field in ("cardio", "psych", "pulm")]
+        # Reports with an empty section are left out and rerun on their own
+        if all(sections):
+            cardio, psych, pulm = sections
+            results[item["id"]] = {"Cardiologist": cardio, "Psychologist": psych, "Pulmonologist": pulm}
+    return results
 
-    # Prepare final text & save to file
-    final_diagnosis_text = "### Final AI-Generated Educational Summary (NOT Medical Advice):\n\n" + final_diagnosis
 
-    txt_output_path = "results/final_diagnosis.txt"
-    os.makedirs(os.path.dirname(txt_output_path), exist_ok=True)
+class BatchScheduler:
+    """
+    Pools the specialist-panel calls of concurrent requests, from both the
+    streaming and the form route, into single Gemini calls.
+
+    While no panel call is in flight a submitted report is dispatched at
+    once. Otherwise reports arriving within `window` seconds are collected,
+    up to `max_batch` of them totalling at most `max_words`. A report that
+    ends up alone gets the regular single-report panel call, and reports
+    missing from a batch answer are retried individually. Calls run on a
+    pool of at most `max_workers` threads. MAX_BATCH=1 keeps every report
+    in its own call.
+    """
 
-    with open(txt_output_path, "w", encoding="utf-8") as f:
-        f.write(final_diagnosis_text)
+    def __init__(self, window: float, max_batch: int, max_words: int, max_workers: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_words = max_words
+        self.queue = queue.Queue()
+        self.held = None
+        self.in_flight = 0
+        self.worker = None
+        self.lock = threading.Lock()
+        # Threads start on first submit, so each forked gunicorn worker has its own
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+
+    @property
+    def busy(self) -> bool:
+        """
+        True when batching is on and another panel call is in flight.
+        """
+        with self.lock:
+            return self.max_batch > 1 and self.in_flight > 0
+
+    @contextmanager
+    def tracking(self):
+        """
+        Count a panel call made outside the scheduler (a direct stream) as
+        in flight, so reports arriving meanwhile are pooled.
+        """
+        with self.lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def submit(self, medical_report: str) -> Future:
+        future = Future()
+        self.queue.put((uuid.uuid4().hex, medical_report, future))
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self):
+        # Started lazily, so each forked gunicorn worker gets its own thread
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._collect, name="batch-scheduler", daemon=True)
+                self.worker.start()
+
+    def _collect(self):
+        while True:
+            # A report that did not fit in the previous batch opens this one
+            item, self.held = self.held or self.queue.get(), None
+            batch = [item]
+            n_words = len(item[1].split())
+
+            deadline = time.monotonic() + (self.window if self.busy else 0)
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                item_words = len(item[1].split())
+                if n_words + item_words > self.max_words:
+                    self.held = item
+                    break
+                batch.append(item)
+                n_words += item_words
+
+            with self.lock:
+                self.in_flight += 1
+            # Keep collecting the next batch while this one is in flight
+            self.executor.submit(self._process, batch)
+
+    def _process(self, batch: list):
+        try:
+            self._dispatch(batch)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _dispatch(self, batch: list):
+        if len(batch) == 1:
+            _, medical_report, future = batch[0]
+            self._resolve(future, medical_report)
+            return
+
+        try:
+            results = analyze_batch({report_id: report for report_id, report, _ in batch})
+        except GeminiUnavailableError as error:
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+        except Exception:
+            app.logger.warning("Batched panel call failed; falling back to single reports", exc_info=True)
+            results = {}
+
+        for report_id, medical_report, future in batch:
+            if report_id in results:
+                future.set_result(results[report_id])
+            else:
+                self.executor.submit(self._resolve, future, medical_report)
+
+    @staticmethod
+    def _resolve(future: Future, medical_report: str):
+        try:
+            future.set_result(batched_specialists(medical_report))
+        except Exception as error:
+            future.set_exception(error)
+
+
+batch_scheduler = BatchScheduler(
+    window=float(os.getenv("BATCH_WINDOW_MS", "50")) / 1000,
+    max_batch=int(os.getenv("MAX_BATCH", "8")),
+    max_words=int(os.getenv("MAX_BATCH_WORDS", "6000")),
+    max_workers=int(os.getenv("BATCH_THREADS", "16")),
+)
+
+
+@cached_analysis
+def analyze_medical_report(medical_report: str):
+    responses, final_diagnosis = run_agents(medical_report)
+
+    # Prepare final text & save to file
+    final_diagnosis_text = FINAL_SUMMARY_HEADER + final_diagnosis
+    txt_output_path = save_final_diagnosis(medical_report, final_diagnosis_text)
 
     return responses, final_diagnosis_text, txt_output_path
 
 
+def stream_specialist_panel(medical_report: str) -> Iterator[tuple]:
+    """
+    Yield (name, report) for each specialist. While other panel calls are
+    in flight the report joins batch_scheduler's next pooled call;
+    otherwise the panel is streamed so each section shows as it completes.
+    """
+    if batch_scheduler.busy:
+        yield from batch_scheduler.submit(medical_report).result().items()
+        return
+
+    with batch_scheduler.tracking():
+        yield from stream_specialists(medical_report)
+
+
+def stream_medical_report_analysis(medical_report: str) -> Iterator[tuple]:
+    """
+    Streaming variant of analyze_medical_report.
+
+    Yields (event, data) pairs: one "specialist" event per specialist as
+    its section completes, "summary" events carrying chunks of the team
+    summary, and a final "done" event with the output path.
+    """
+    cached, embedding = cache_lookup(medical_report)
+    if cached is not None:
+        responses, final_diagnosis_text, txt_output_path = cached
+        for name, text in responses.items():
+            yield "specialist", {"name": name, "text": text}
+        yield "summary", {"text": final_diagnosis_text}
+        yield "done", {"output_path": txt_output_path}
+        return
+
+    responses = {}
+    for name, text in stream_specialist_panel(medical_report):
+        responses[name] = text
+        yield "specialist", {"name": name, "text": text}
+
+    # Team call starts the moment the last specialist section closes
+    summary_parts = [FINAL_SUMMARY_HEADER]
+    yield "summary", {"text": FINAL_SUMMARY_HEADER}
+
+    for chunk in stream_multidisciplinary_team(
+        cardiologist_report=responses["Cardiologist"],
+        psychologist_report=responses["Psychologist"],
+        pulmonologist_report=responses["Pulmonologist"],
+    ):
+        summary_parts.append(chunk)
+        yield "summary", {"text": chunk}
+
+    final_diagnosis_text = "".join(summary_parts)
+    txt_output_path = save_final_diagnosis(medical_report, final_diagnosis_text)
+    cache_store(medical_report, (responses, final_diagnosis_text, txt_output_path), embedding)
+    yield "done", {"output_path": txt_output_path}
+
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# 5. Flask app with dark-mode UI
+# 6. Flask app with dark-mode UI
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson (used by jsonify and request.json).
+    """
+
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=self.options).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.options),
+            content_type="application/json; charset=utf-8",
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
+# Reject oversized form posts before they are parsed
+app.config["MAX_CONTENT_LENGTH"] = 256 * 1024
 
-INDEX_HTML = """
-<!doctype html>
-<html lang="en">
-<head>
-    <meta charset="utf-8">
-    <title>AI Medical Multi-Agent (Gemini 2.5 Flash)</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-
-    <!-- Simple font -->
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-
-    <style>
-        :root {
-            --bg-main: #020617;
-            --bg-card: #020617;
-            --bg-card-soft: #020617;
-            --accent: #38bdf8;
-            --accent-soft: rgba(56, 189, 248, 0.15);
-            --text-main: #e5e7eb;
-            --text-muted: #9ca3af;
-            --border-subtle: rgba(148, 163, 184, 0.3);
-            --danger: #f97373;
-        }
-
-        * {
-            box-sizing: border-box;
-        }
-
-        body {
-            margin: 0;
-            padding: 0;
-            font-family: "Inter", system-ui, -apple-system, BlinkMacSystemFont, sans-serif;
-            background: radial-gradient(circle at top, #0f172a, #020617 60%);
-            color: var(--text-main);
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: flex-start;
-        }
-
-        .wrapper {
-            width: 100%;
-            max-width: 1100px;
-            padding: 24px 16px 40px;
-        }
-
-        .glass-card {
-            background: radial-gradient(circle at top left, rgba(56, 189, 248, 0.06), transparent 40%),
-                        radial-gradient(circle at bottom right, rgba(168, 85, 247, 0.05), transparent 50%),
-                        rgba(15, 23, 42, 0.96);
-            border-radius: 18px;
-            border: 1px solid rgba(148, 163, 184, 0.4);
-            box-shadow:
-                0 24px 80px rgba(15, 23, 42, 0.9),
-                0 0 0 1px rgba(15, 23, 42, 0.9);
-            padding: 24px 22px 22px;
-            backdrop-filter: blur(24px);
-        }
-
-        .header {
-            display: flex;
-            flex-direction: column;
-            gap: 6px;
-            margin-bottom: 20px;
-        }
-
-        .badge {
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            padding: 4px 10px;
-            border-radius: 999px;
-            background: rgba(15, 23, 42, 0.9);
-            border: 1px solid rgba(56, 189, 248, 0.35);
-            font-size: 12px;
-            color: var(--accent);
-            width: fit-content;
-        }
-
-        .pulse-dot {
-            width: 6px;
-            height: 6px;
-            border-radius: 999px;
-            background: var(--accent);
-            box-shadow: 0 0 0 4px rgba(56, 189, 248, 0.4);
-        }
-
-        h1 {
-            font-size: 22px;
-            font-weight: 600;
-            margin: 0;
-            letter-spacing: 0.02em;
-            color: #f9fafb;
-        }
-
-        .subtitle {
-            margin: 0;
-            font-size: 13px;
-            color: var(--text-muted);
-        }
-
-        .warning {
-            margin-top: 10px;
-            padding: 8px 10px;
-            border-radius: 10px;
-            border: 1px solid rgba(248, 113, 113, 0.4);
-            background: rgba(24, 24, 27, 0.9);
-            font-size: 12px;
-            color: #fecaca;
-            display: flex;
-            align-items: flex-start;
-            gap: 8px;
-        }
-
-        .warning-icon {
-            font-size: 14px;
-            margin-top: 2px;
-        }
-
-        form {
-            margin-top: 18px;
-            display: flex;
-            flex-direction: column;
-            gap: 8px;
-        }
-
-        label {
-            font-size: 13px;
-            font-weight: 500;
-            color: #e5e7eb;
-        }
-
-        textarea {
-            width: 100%;
-            min-height: 200px;
-            resize: vertical;
-            padding: 10px 11px;
-            border-radius: 12px;
-            border: 1px solid var(--border-subtle);
-            background: rgba(15, 23, 42, 0.9);
-            color: var(--text-main);
-            font-size: 13px;
-            font-family: "JetBrains Mono", "Consolas", ui-monospace, SFMono-Regular, Menlo, Monaco, monospace;
-        }
-
-        textarea:focus {
-            outline: none;
-            border-color: var(--accent);
-            box-shadow: 0 0 0 1px rgba(56, 189, 248, 0.4);
-        }
-
-        .controls {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-top: 6px;
-            gap: 12px;
-            flex-wrap: wrap;
-        }
-
-        .hint {
-            font-size: 11px;
-            color: var(--text-muted);
-        }
-
-        .btn-primary {
-            border: none;
-            padding: 8px 16px;
-            border-radius: 999px;
-            font-size: 13px;
-            font-weight: 500;
-            cursor: pointer;
-            background: linear-gradient(135deg, #38bdf8, #6366f1);
-            color: #0b1020;
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            box-shadow: 0 10px 30px rgba(56, 189, 248, 0.4);
-            transition: transform 0.08s ease, box-shadow 0.08s ease, filter 0.08s ease;
-        }
-
-        .btn-primary span.icon {
-            font-size: 15px;
-        }
-
-        .btn-primary:hover {
-            transform: translateY(-1px);
-            filter: brightness(1.05);
-            box-shadow: 0 14px 40px rgba(56, 189, 248, 0.55);
-        }
-
-        .btn-primary:active {
-            transform: translateY(0);
-            box-shadow: 0 8px 24px rgba(56, 189, 248, 0.3);
-        }
-
-        .error {
-            margin-top: 10px;
-            font-size: 13px;
-            color: #fecaca;
-        }
-
-        .results-wrapper {
-            margin-top: 20px;
-            display: grid;
-            grid-template-columns: minmax(0, 1.15fr) minmax(0, 1.15fr);
-            gap: 14px;
-        }
-
-        @media (max-width: 900px) {
-            .results-wrapper {
-                grid-template-columns: minmax(0, 1fr);
-            }
-        }
-
-        .result-card {
-            border-radius: 16px;
-            border: 1px solid rgba(148, 163, 184, 0.4);
-            background: radial-gradient(circle at top, rgba(15, 23, 42, 0.9), rgba(15, 23, 42, 0.98));
-            padding: 14px 12px;
-        }
-
-        .result-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 6px;
-        }
-
-        .result-title {
-            font-size: 14px;
-            font-weight: 600;
-            display: flex;
-            align-items: center;
-            gap: 6px;
-        }
-
-        .role-pill {
-            padding: 3px 9px;
-            border-radius: 999px;
-            background: rgba(15, 23, 42, 0.9);
-            border: 1px solid rgba(148, 163, 184, 0.5);
-            font-size: 10px;
-            text-transform: uppercase;
-            letter-spacing: 0.06em;
-            color: var(--text-muted);
-        }
-
-        .role-icon {
-            width: 18px;
-            height: 18px;
-            border-radius: 999px;
-            background: rgba(248, 250, 252, 0.06);
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 11px;
-        }
-
-        pre {
-            margin: 0;
-            font-size: 12px;
-            line-height: 1.5;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-            background: #020617;
-            border-radius: 10px;
-            padding: 8px 10px;
-            border: 1px solid rgba(31, 41, 55, 0.9);
-            font-family: "JetBrains Mono", "Consolas", ui-monospace, SFMono-Regular, Menlo, Monaco, monospace;
-            max-height: 420px;
-            overflow: auto;
-        }
-
-        .summary-card {
-            grid-column: span 2;
-        }
-
-        @media (max-width: 900px) {
-            .summary-card {
-                grid-column: span 1;
-            }
-        }
-
-        .summary-tagline {
-            font-size: 11px;
-            color: var(--text-muted);
-            margin: 2px 0 0;
-        }
-
-        .file-info {
-            margin-top: 6px;
-            font-size: 11px;
-            color: var(--text-muted);
-        }
-
-        code {
-            font-family: "JetBrains Mono", "Consolas", ui-monospace, SFMono-Regular, Menlo, Monaco, monospace;
-            font-size: 11px;
-            background: rgba(15, 23, 42, 0.9);
-            padding: 1px 6px;
-            border-radius: 999px;
-            border: 1px solid rgba(75, 85, 99, 0.8);
-        }
-    </style>
-</head>
-<body>
-    <div class="wrapper">
-        <div class="glass-card">
-            <div class="header">
-                <div class="badge">
-                    <span class="pulse-dot"></span>
-                    <span>Gemini 2.5 Flash · Multi-Agent Medical Demo</span>
-                </div>
-                <h1>AI-Assisted Medical Report Analysis</h1>
-                <p class="subtitle">
-                    Parallel specialist-style AI agents (Cardiology · Psychology · Pulmonology) plus a final multidisciplinary summary.
-                </p>
-
-                <div class="warning">
-                    <span class="warning-icon">⚠</span>
-                    <span>
-                        This tool is for <strong>educational and experimental</strong> purposes only.
-                        It is <strong>NOT</strong> medical advice, diagnosis, or treatment.
-                        Always consult a licensed medical professional for real health concerns.
-                    </span>
-                </div>
-            </div>
-
-            <form method="POST">
-                <label for="report">Paste Medical Report Text</label>
-                <textarea id="report" name="report" placeholder="Paste or type the clinical / medical note you want the AI agents to analyze...">{{ report or "" }}</textarea>
-
-                <div class="controls">
-                    <p class="hint">
-                        Tip: Remove any personal identifying information before pasting. Short notes also work — the agents will still collaborate.
-                    </p>
-                    <button type="submit" class="btn-primary">
-                        <span class="icon">⚡</span>
-                        <span>Analyze with AI Agents</span>
-                    </button>
-                </div>
-            </form>
-
-            {% if error %}
-                <div class="error">{{ error }}</div>
-            {% endif %}
-
-            {% if final_diagnosis %}
-            <div class="results-wrapper">
-                <div class="result-card">
-                    <div class="result-header">
-                        <div class="result-title">
-                            <div class="role-icon">♥</div>
-                            <span>Cardiologist</span>
-                        </div>
-                        <span class="role-pill">Specialist View</span>
-                    </div>
-                    <pre>{{ cardiologist_report }}</pre>
-                </div>
-
-                <div class="result-card">
-                    <div class="result-header">
-                        <div class="result-title">
-                            <div class="role-icon">Ψ</div>
-                            <span>Psychologist</span>
-                        </div>
-                        <span class="role-pill">Specialist View</span>
-                    </div>
-                    <pre>{{ psychologist_report }}</pre>
-                </div>
-
-                <div class="result-card">
-                    <div class="result-header">
-                        <div class="result-title">
-                            <div class="role-icon">☁</div>
-                            <span>Pulmonologist</span>
-                        </div>
-                        <span class="role-pill">Specialist View</span>
-                    </div>
-                    <pre>{{ pulmonologist_report }}</pre>
-                </div>
-
-                <div class="result-card summary-card">
-                    <div class="result-header">
-                        <div class="result-title">
-                            <div class="role-icon">◎</div>
-                            <span>Multidisciplinary Summary</span>
-                        </div>
-                        <span class="role-pill">AI-Generated · Not Medical Advice</span>
-                    </div>
-                    <p class="summary-tagline">
-                        Integrated view combining cardiology, psychology, and pulmonology perspectives into one educational summary.
-                    </p>
-                    <pre>{{ final_diagnosis }}</pre>
-                    <p class="file-info">
-                        Saved locally as <code>{{ output_path }}</code>
-                    </p>
-                </div>
-            </div>
-            {% endif %}
-        </div>
-    </div>
-</body>
-</html>
-"""
+# Brotli/gzip for pages, CSS and JSON. text/event-stream is deliberately left
+# out so streamed analysis events are flushed to the browser immediately.
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 500
+app.config["COMPRESS_MIMETYPES"] = ["text/html", "text/css", "application/javascript", "application/json"]
+Compress(app)
+
+
+def warm_up_client():
+    """
+    Make one cheap call so DNS, TCP and TLS setup happen at startup rather
+    than on the first user's request. Failures are logged, not raised.
+
+    Run per serving process (gunicorn worker or dev server), never at
+    import, so importing the module makes no network calls.
+    """
+    try:
+        client.models.list(config={"page_size": 1})
+    except Exception:
+        app.logger.warning("Gemini warm-up call failed", exc_info=True)
+
+
+def reinit_after_fork():
+    """
+    Called in each gunicorn worker after fork (see gunicorn.conf.py). The
+    client and cache connections inherited from the preloaded master must
+    not be shared between processes, so each worker opens its own.
+    """
+    global client
+    client = create_client()
+    result_cache.close()
+    rate_limit_store.close()
+    warm_up_client()
+
+# Versioned static assets are safe to cache forever: the URL changes with
+# the file contents.
+STATIC_MAX_AGE = 31536000
+
+
+@lru_cache(maxsize=None)
+def static_version(filename: str) -> str:
+    path = os.path.join(app.static_folder, filename)
+    with open(path, "rb") as f:
+        # Only identifies a file version, so no FIPS-approved digest is needed
+        return hashlib.md5(f.read(), usedforsecurity=False).hexdigest()[:12]
+
+
+@app.context_processor
+def inject_static_url():
+    def static_url(filename: str) -> str:
+        return url_for("static", filename=filename, v=static_version(filename))
+    return {"static_url": static_url}
+
+
+@app.after_request
+def cache_static_assets(response):
+    if request.path.startswith("/static/") and "v" in request.args:
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return response
+
+
+BUSY_MESSAGE = "The AI service is busy right now. Please try again in a minute."
+
+# Cheap checks that turn away junk before any Gemini call is made
+MIN_REPORT_WORDS = 20
+MAX_REPORT_WORDS = 4000
+# Whole words only, so "latest" or "example" do not count as "test"/"exam";
+# stems such as "diagnos" take any ending (diagnosis, diagnosed, ...)
+MEDICAL_KEYWORDS = re.compile(
+    r"\b(?:"
+    r"patients?|symptom\w*|complain\w*|histor(?:y|ies)|diagnos\w*|medications?|"
+    r"treatments?|pain(?:s|ful)?|blood|pressure|heart|breath\w*|chest|"
+    r"lungs?|cough\w*|fever\w*|fatigue[ds]?|sleep\w*|anxiety|anxious|"
+    r"exam(?:s|ination\w*)?|tests?|doctors?|clinic\w*|hospital\w*|mg"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def validate_report(report: str) -> Optional[str]:
+    """
+    Return an error message if the report should not be analyzed, else None.
+    """
+    if not report:
+        return "Please paste a medical report first."
+
+    n_words = len(report.split())
+    if n_words < MIN_REPORT_WORDS:
+        return f"Report too short: please paste at least {MIN_REPORT_WORDS} words."
+    if n_words > MAX_REPORT_WORDS:
+        return f"Report too long: please keep it under {MAX_REPORT_WORDS} words."
+
+    if not MEDICAL_KEYWORDS.search(report):
+        return "This does not look like a medical report. Please paste clinical notes."
+
+    return None
 
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
         report = request.form.get("report", "").strip()
-        if not report:
-            return render_template_string(
-                INDEX_HTML,
-                error="Please paste a medical report first.",
-                report="",
+        error = validate_report(report)
+
+        # Escape each value once here; Jinja passes Markup through untouched
+        safe_report = escape(report)
+        if error:
+            return render_template(
+                "index.html",
+                error=error,
+                report=safe_report,
             )
 
-        specialist_reports, final_diagnosis_text, output_path = analyze_medical_report(report)
+        try:
+            specialist_reports, final_diagnosis_text, output_path = analyze_medical_report(report)
+        except GeminiUnavailableError:
+            return render_template(
+                "index.html",
+                error=BUSY_MESSAGE,
+                report=safe_report,
+            )
 
-        return render_template_string(
-            INDEX_HTML,
-            report=report,
-            cardiologist_report=specialist_reports.get("Cardiologist", ""),
-            psychologist_report=specialist_reports.get("Psychologist", ""),
-            pulmonologist_report=specialist_reports.get("Pulmonologist", ""),
-            final_diagnosis=final_diagnosis_text,
+        return render_template(
+            "index.html",
+            report=safe_report,
+            cardiologist_report=escape(specialist_reports.get("Cardiologist", "")),
+            psychologist_report=escape(specialist_reports.get("Psychologist", "")),
+            pulmonologist_report=escape(specialist_reports.get("Pulmonologist", "")),
+            final_diagnosis=escape(final_diagnosis_text),
             output_path=output_path,
             error=None,
         )
 
     # GET
-    return render_template_string(INDEX_HTML, report="", error=None)
+    return render_template("index.html", report="", error=None)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Format one server-sent event frame with a JSON payload.
+    """
+    return f"event: {event}\ndata: {orjson.dumps(data).decode('utf-8')}\n\n"
+
+
+TOO_LARGE_MESSAGE = f"Report too long: please keep it under {MAX_REPORT_WORDS} words."
+
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """
+    Bodies over MAX_CONTENT_LENGTH never reach validate_report; answer in
+    the format the caller expects instead of Flask's bare HTML error page.
+    """
+    if request.path == url_for("analyze_stream"):
+        return Response(
+            sse_event("error", {"message": TOO_LARGE_MESSAGE}),
+            status=413,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+    return render_template("index.html", report="", error=TOO_LARGE_MESSAGE), 413
+
+
+@app.route("/analyze/stream", methods=["POST"])
+def analyze_stream():
+    report = request.form.get("report", "").strip()
+    error = validate_report(report)
+
+    def generate():
+        if error:
+            yield sse_event("error", {"message": error})
+            return
+
+        try:
+            for event, data in stream_medical_report_analysis(report):
+                yield sse_event(event, data)
+        except GeminiUnavailableError:
+            yield sse_event("error", {"message": BUSY_MESSAGE})
+        except Exception:
+            app.logger.exception("Streaming analysis failed")
+            yield sse_event("error", {"message": "The analysis failed. Please try again."})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/cache/clear", methods=["POST"])
+def clear_cache():
+    """
+    Admin route: drop every cached analysis. Disabled unless ADMIN_TOKEN is
+    set; callers must send it in the X-Admin-Token header.
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token):
+        abort(403)
+
+    return jsonify({"cleared": analyze_medical_report.cache_clear()})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see wsgi.py).
+    # The reloader stays off even in debug so the module (and its Gemini
+    # client) is imported once.
+    warm_up_client()
+    app.run(
+        host="0.0.0.0",
+        port=5000,
+        debug=os.getenv("FLASK_ENV") == "development",
+        use_reloader=False,
+    )
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Picked up automatically by `gunicorn wsgi:app` from the project root.
+#
+# Every request spends seconds waiting on Gemini, so each worker runs a
+# thread pool: while one thread waits on the network the others keep
+# serving (including long-lived /analyze/stream responses).
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# The app is IO-bound, so concurrency comes from threads, not processes.
+# Keeping workers few also lets concurrent requests meet in the same
+# in-process batch scheduler. Set the count through WEB_CONCURRENCY only
+# (not `gunicorn -w`), so this file stays the single source for it.
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# Long enough for a full specialist + team analysis
+timeout = 120
+
+# Import the app (templates, prompts, client) once in the master, then fork.
+# Each worker reopens its own Gemini connection in post_fork, since TLS
+# sessions must not be shared across processes.
+preload_app = True
+
+
+def post_fork(server, worker):
+    import app
+
+    app.reinit_after_fork()
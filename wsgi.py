@@ -0,0 +1,9 @@
+# wsgi.py
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Production entry point:
+#   gunicorn wsgi:app
+# Server settings (workers, threads, timeout) live in gunicorn.conf.py.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from app import app
+
+__all__ = ["app"]